@@ -16,6 +16,7 @@ double solve_dp(double weights[], double profits[],
     unsigned short offset = 0;
 
     unsigned long w[num_items];
+    unsigned short set_offsets[num_sets];
 
     // transform weights to non-negative integers
     double tc = (double) total_charge;
@@ -35,6 +36,7 @@ double solve_dp(double weights[], double profits[],
                 wmax = weights[i + offset];
             }
         }
+        set_offsets[k] = offset;
         tc -= wmin;
         max_sum += wmax - wmin;
         for (i = 0; i < sets[k]; i++)
@@ -62,6 +64,7 @@ double solve_dp(double weights[], double profits[],
     unsigned long lower = (unsigned long) lower_signed;
 
     // init DP and traceback tables
+    // tb holds the item chosen from set k at capacity d, at k * (upper + 1) + d
     double dp[upper + 1];
     unsigned short tb[(upper + 1) * num_sets];
     dp[0] = 0;
@@ -99,12 +102,8 @@ double solve_dp(double weights[], double profits[],
             if (max_val > -INFINITY)
             {
                 dp[d] = max_val;
-                // copy old traceback indices
-                for (i = 0; i < k; i++) {
-                    tb[(d * num_sets) + i] = tb[((d - w[max_idx + offset]) * num_sets) + i];
-                }
                 // add new index to traceback
-                tb[(d * num_sets) + k] = max_idx;
+                tb[(k * (upper + 1)) + d] = max_idx;
             }
             else
             {
@@ -127,12 +126,16 @@ double solve_dp(double weights[], double profits[],
         }
     }
 
-    // copy solution
+    // trace back the solution
     if (max_val > -INFINITY)
     {
-        for (k = 0; k < num_sets; k++)
+        d = max_pos;
+        k = num_sets;
+        while (k > 0)
         {
-            solution[k] = tb[(max_pos * num_sets) + k];
+            k--;
+            solution[k] = tb[(k * (upper + 1)) + d];
+            d -= w[set_offsets[k] + solution[k]];
         }
     }
 
@@ -1,6 +1,7 @@
-from typing import List
+from typing import Any, Dict, List, Tuple
 
 
 Atom = int
 ChargeList = List[float]
 WeightList = List[float]
+AtomDataList = List[Tuple[Atom, Dict[str, Any]]]
@@ -1,16 +1,20 @@
 import inspect
 import sys
 from abc import ABC, abstractmethod
+import collections.abc
 from types import MethodType
-from typing import Iterable, Optional, Union
+from typing import Iterable, List, Optional, Union
 
 import networkx as nx
+import numpy as np
 
 from charge import util
+from charge.charge_types import AtomDataList
 from charge.collectors import HistogramCollector, MeanCollector, ModeCollector, MedianCollector, CachingCollector
-from charge.nauty import Nauty
+from charge.nauty import Nauty, get_default_nauty
 from charge.repository import Repository
-from charge.settings import ROUNDING_DIGITS, DEFAULT_TOTAL_CHARGE, MAX_ROUNDING_DIGITS, MAX_BINS, ILP_SOLVER_MAX_SECONDS
+from charge.settings import ROUNDING_DIGITS, DEFAULT_TOTAL_CHARGE, MAX_ROUNDING_DIGITS, MAX_BINS, ILP_SOLVER_MAX_SECONDS, \
+    ILP_SOLVER_BACKEND
 from charge.solvers import CDPSolver, DPSolver, ILPSolver, SimpleSolver, SymmetricILPSolver, SymmetricDPSolver, \
     SymmetricCDPSolver, SymmetricRelaxedILPSolver
 
@@ -36,10 +40,14 @@ class Charger(ABC):
             nauty: An external Nauty instance to use for canonization
         """
         # These are all protected, not private
-        self._nauty = nauty if nauty is not None else Nauty()
+        self._nauty = nauty if nauty is not None else get_default_nauty()
         self._repo = repository
         self._rounding_digits = min(max(rounding_digits, 0), MAX_ROUNDING_DIGITS)
 
+        # Default shell sizes, largest first, and the repository state they were derived from
+        self._default_shells = sorted(repository.charges_iacm.keys(), reverse=True)
+        self._default_shells_origin = (repository.charges_iacm, len(repository.charges_iacm))
+
         # To be assigned in derived classes
         self._collector = None      # type: Collector
         self._solver = None         # type: Solver
@@ -66,25 +74,49 @@ class Charger(ABC):
             total_charge: Total charge of the molecule
         """
         if not shell:
-            shells = sorted(self._repo.charges_iacm.keys(), reverse=True)
+            shells = self.__get_default_shells()
         elif isinstance(shell, int):
             shells = [shell]
-        elif isinstance(shell, Iterable):
-            shells = shell
+        elif isinstance(shell, collections.abc.Iterable):
+            # collectors iterate over the shells once per atom
+            shells = list(shell)
         else:
             raise TypeError('shell must be int or List[int]')
 
         if iacmize:
             graph = util.iacmize(graph)
 
-        values, keydict = self._collector.collect_values(graph, iacm_data_only or iacmize, shells, **kwargs)
+        # The attribute dicts are shared with the graph, so this stays
+        # up to date when the solver adds charges and scores.
+        atoms = list(graph.nodes(data=True))
+
+        values, keydict = self._collector.collect_values(
+                graph, iacm_data_only or iacmize, shells, atoms=atoms, **kwargs)
         self._solver.solve_partial_charges(graph, values, total_charge, keydict, **kwargs)
-        self.__add_redistributed_charges(graph, total_charge)
+        self.__add_redistributed_charges(graph, total_charge, atoms)
+
+    def __get_default_shells(self) -> List[int]:
+        """Return the shell sizes in the repository, largest first.
+
+        The sorted list is cached, and only recomputed if the shells \
+        in the repository have been replaced, added or removed.
+
+        Returns:
+            A list of shell sizes in descending order.
+        """
+        charges_iacm = self._repo.charges_iacm
+        # keep a reference to the dict, so that its id cannot be reused
+        origin_charges_iacm, origin_len = self._default_shells_origin
+        if origin_charges_iacm is not charges_iacm or origin_len != len(charges_iacm):
+            self._default_shells = sorted(charges_iacm.keys(), reverse=True)
+            self._default_shells_origin = (charges_iacm, len(charges_iacm))
+        return self._default_shells
 
     def __add_redistributed_charges(
             self,
             graph: nx.Graph,
-            total_charge: int
+            total_charge: int,
+            atoms: AtomDataList
             ) -> None:
         """Add adjusted charges that fit the exact desired total charge.
 
@@ -98,32 +130,40 @@ class Charger(ABC):
         Args:
             graph: The molecule graph to adjust
             total_charge: The total charge to match.
+            atoms: The atoms of the graph and their attributes, as \
+                    returned by graph.nodes(data=True).
         """
+        if len(atoms) == 0:
+            return
+
+        num_atoms = len(atoms)
+        scores = np.fromiter((data['score'] for _, data in atoms), dtype=np.float64, count=num_atoms)
+        charges = np.fromiter((data['partial_charge'] for _, data in atoms), dtype=np.float64, count=num_atoms)
+
         total_score = graph.graph['score']
         total_error = total_charge - graph.graph['total_charge']
 
-        total_charge_redist = 0
-        min_score = float('inf')
-        min_atom_data = None
-        proportions = {}
-        total_prop = 0
-        for v, data in graph.nodes().data():
-            proportions[v] = total_score / data['score'] if data['score'] > 0 else 0
-            total_prop += proportions[v]
-
-        for v, data in graph.nodes().data():
-            delta = round((proportions[v] * total_error) / total_prop, self._rounding_digits)
-            data['partial_charge_redist'] = round(data['partial_charge'] + delta, self._rounding_digits)
-            total_charge_redist += data['partial_charge_redist']
-            if data['score'] < min_score:
-                min_score = data['score']
-                min_atom_data = data
-
-        if min_atom_data:
-            min_atom_data['partial_charge_redist'] = round(min_atom_data['partial_charge_redist'] +
-                    total_charge - total_charge_redist, self._rounding_digits)
-            total_charge_redist += total_charge - total_charge_redist
-            graph.graph['total_charge_redist'] = round(total_charge_redist, self._rounding_digits)
+        proportions = np.zeros(num_atoms, dtype=np.float64)
+        np.divide(total_score, scores, out=proportions, where=scores > 0)
+        total_prop = proportions.sum()
+
+        # Work in integer multiples of the rounding grain, so that the
+        # rounded charges sum up to the total charge exactly. np.rint
+        # rounds halves to even.
+        blowup = 10 ** self._rounding_digits
+        charges_redist = charges * blowup
+        if total_prop > 0:
+            charges_redist += np.rint(proportions * total_error / total_prop * blowup)
+        charges_redist = np.rint(charges_redist).astype(np.int64)
+
+        # put the remaining error on the atom we're least certain about
+        target = int(round(total_charge * blowup))
+        min_atom = int(np.argmin(scores))
+        charges_redist[min_atom] += target - int(charges_redist.sum())
+
+        for (_, data), charge_redist in zip(atoms, charges_redist.tolist()):
+            data['partial_charge_redist'] = charge_redist / blowup
+        graph.graph['total_charge_redist'] = target / blowup
 
 
 class MeanCharger(Charger):
@@ -143,8 +183,8 @@ class MeanCharger(Charger):
         """Create a MeanCharger.
 
         Nauty instances manage an external process, so they're \
-        somewhat expensive to create. If you have multiple chargers, \
-        you could consider sharing one between them.
+        somewhat expensive to create. If none is given, a default \
+        instance shared with other chargers is used.
 
         Args:
             repository: The repository to get charges from
@@ -176,8 +216,8 @@ class MedianCharger(Charger):
         """Create a MeanCharger.
 
         Nauty instances manage an external process, so they're \
-        somewhat expensive to create. If you have multiple chargers, \
-        you could consider sharing one between them.
+        somewhat expensive to create. If none is given, a default \
+        instance shared with other chargers is used.
 
         Args:
             repository: The repository to get charges from
@@ -210,8 +250,8 @@ class ModeCharger(Charger):
         """Create a ModeCharger.
 
         Nauty instances manage an external process, so they're \
-        somewhat expensive to create. If you have multiple chargers, \
-        you could consider sharing one between them.
+        somewhat expensive to create. If none is given, a default \
+        instance shared with other chargers is used.
 
         Args:
             repository: The repository to get charges from
@@ -240,13 +280,14 @@ class ILPCharger(Charger):
             nauty: Optional[Nauty]=None,
             caching: Optional[bool] = False,
             scoring: Optional[MethodType]=None,
-            max_bins: Optional[int] = MAX_BINS
+            max_bins: Optional[int] = MAX_BINS,
+            backend: Optional[str] = ILP_SOLVER_BACKEND
             ) -> None:
         """Create an ILPCharger.
 
         Nauty instances manage an external process, so they're \
-        somewhat expensive to create. If you have multiple chargers, \
-        you could consider sharing one between them.
+        somewhat expensive to create. If none is given, a default \
+        instance shared with other chargers is used.
 
         Args:
             repository: The repository to get charges from
@@ -260,12 +301,15 @@ class ILPCharger(Charger):
              :func:`~charge.collectors.HistogramCollector.score_histogram_count`, \
              :func:`~charge.collectors.HistogramCollector.score_histogram_log`, and \
              :func:`~charge.collectors.HistogramCollector.score_histogram_martin`.
+            max_bins: The maximum number of histogram bins per atom
+            backend: The ILP solver to use, 'pulp' or 'highs'. See \
+                    :class:`~charge.solvers.ILPSolver`.
         """
         super().__init__(repository, rounding_digits, nauty)
         self._collector = HistogramCollector(repository, rounding_digits, self._nauty, scoring, max_bins)
         if caching:
             self._collector = CachingCollector(self._collector)
-        self._solver = ILPSolver(rounding_digits, max_seconds)
+        self._solver = ILPSolver(rounding_digits, max_seconds, backend)
 
 class SymmetricILPCharger(Charger):
     """A charger that uses Integer Linear Programming.
@@ -286,8 +330,8 @@ class SymmetricILPCharger(Charger):
         """Create an ILPCharger.
 
         Nauty instances manage an external process, so they're \
-        somewhat expensive to create. If you have multiple chargers, \
-        you could consider sharing one between them.
+        somewhat expensive to create. If none is given, a default \
+        instance shared with other chargers is used.
 
         Args:
             repository: The repository to get charges from
@@ -327,8 +371,8 @@ class SymmetricRelaxedILPCharger(Charger):
         """Create an ILPCharger.
 
         Nauty instances manage an external process, so they're \
-        somewhat expensive to create. If you have multiple chargers, \
-        you could consider sharing one between them.
+        somewhat expensive to create. If none is given, a default \
+        instance shared with other chargers is used.
 
         Args:
             repository: The repository to get charges from
@@ -369,8 +413,8 @@ class DPCharger(Charger):
         """Create an DPCharger.
 
         Nauty instances manage an external process, so they're \
-        somewhat expensive to create. If you have multiple chargers, \
-        you could consider sharing one between them.
+        somewhat expensive to create. If none is given, a default \
+        instance shared with other chargers is used.
 
         Args:
             repository: The repository to get charges from
@@ -407,8 +451,8 @@ class SymmetricDPCharger(Charger):
         """Create an DPCharger.
 
         Nauty instances manage an external process, so they're \
-        somewhat expensive to create. If you have multiple chargers, \
-        you could consider sharing one between them.
+        somewhat expensive to create. If none is given, a default \
+        instance shared with other chargers is used.
 
         Args:
             repository: The repository to get charges from
@@ -446,8 +490,8 @@ class CDPCharger(Charger):
         """Create a CDPCharger.
 
         Nauty instances manage an external process, so they're \
-        somewhat expensive to create. If you have multiple chargers, \
-        you could consider sharing one between them.
+        somewhat expensive to create. If none is given, a default \
+        instance shared with other chargers is used.
 
         Args:
             repository: The repository to get charges from
@@ -485,8 +529,8 @@ class SymmetricCDPCharger(Charger):
         """Create a CDPCharger.
 
         Nauty instances manage an external process, so they're \
-        somewhat expensive to create. If you have multiple chargers, \
-        you could consider sharing one between them.
+        somewhat expensive to create. If none is given, a default \
+        instance shared with other chargers is used.
 
         Args:
             repository: The repository to get charges from
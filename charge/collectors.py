@@ -1,20 +1,103 @@
 from abc import ABC, abstractmethod
-from math import log
+from math import fsum, log
 from types import MethodType
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
 
 import networkx as nx
 import numpy as np
 
-from charge.charge_types import ChargeList, WeightList
-from charge.nauty import Nauty
+from charge.charge_types import AtomDataList, ChargeList, WeightList
+from charge.nauty import Nauty, get_default_nauty
 from charge.repository import Repository, EitherChargeSet, _VersioningList
 from charge.settings import MAX_BINS
-from charge.util import AssignmentError, third_quartile, round_to, median, first_quartile
+from charge.util import AssignmentError, bfs_nodes, third_quartile, round_to, median, first_quartile, njit
 
 Atom = Any  # TODO: define this for the whole library
 
 
+_round_to = njit(cache=True)(round_to)
+
+
+@njit(cache=True)
+def _arange(start: float, stop: float, step: float) -> np.ndarray:
+    """Same as np.arange(start, stop, step), to the last bit.
+
+    numba's np.arange accumulates round-off differently, which would \
+    move charges that lie exactly on a bin edge between bins.
+    """
+    length = max(int(np.ceil((stop - start) / step)), 0)
+    values = np.empty(length)
+    if length > 0:
+        values[0] = start
+    if length > 1:
+        values[1] = start + step
+        delta = values[1] - values[0]
+        for i in range(2, length):
+            values[i] = start + i * delta
+    return values
+
+
+@njit(cache=True)
+def _histogram_kernel(
+        charges: np.ndarray,
+        grain: float,
+        max_bins: int,
+        median_charge: float,
+        spacing: float
+        ) -> Tuple[np.ndarray, np.ndarray]:
+    """Bin charges, widening the bins until at most max_bins are non-empty.
+
+    See HistogramCollector._calculate_histogram(). This is compiled \
+    with numba if it is available, and runs as plain NumPy otherwise.
+
+    Args:
+        charges: The charges to process into a histogram
+        grain: The smallest difference between two charges
+        max_bins: The maximum number of non-empty bins
+        median_charge: The median charge, rounded to grain
+        spacing: The initial bin width, in units of grain
+
+    Returns:
+        The centers of the non-empty bins, and their counts.
+    """
+    min_charge = charges.min()
+    max_charge = charges.max()
+
+    bin_centers = np.zeros(1)
+    counts = np.zeros(1, dtype=np.int64)
+    num_bins = max_bins + 1
+    while num_bins > max_bins:
+        step = grain * spacing
+
+        # align center bin to median and find edge bin centers
+        min_charge_bin = median_charge - _round_to(median_charge - min_charge, step)
+        max_charge_bin = median_charge + _round_to(max_charge - median_charge, step)
+
+        # add half a step to include the last value
+        bin_centers = _arange(min_charge_bin, max_charge_bin + 0.5 * step, step)
+
+        min_bin_edge = min_charge_bin - 0.5 * step
+        max_bin_edge = max_charge_bin + 0.5 * step
+        # add half a step to include the last value
+        bin_edges = _arange(min_bin_edge, max_bin_edge + 0.5 * step, step)
+        # extend a bit to compensate for round-off error
+        bin_edges[-1] += 1e-15
+
+        # bins are closed on the left, except for the last one which
+        # also includes its right edge, exactly like numpy.histogram
+        total_bins = bin_edges.shape[0] - 1
+        bin_idx = np.searchsorted(bin_edges, charges, side='right') - 1
+        bin_idx[charges == bin_edges[-1]] = total_bins - 1
+        in_range = (bin_idx >= 0) & (bin_idx < total_bins)
+
+        counts = np.bincount(bin_idx[in_range], minlength=total_bins)
+        num_bins = np.count_nonzero(counts)
+        spacing += 1.0
+
+    nonzero_bins = np.flatnonzero(counts)
+    return bin_centers[nonzero_bins], counts[nonzero_bins]
+
+
 class Collector(ABC):
     """Base class for collectors.
 
@@ -41,13 +124,14 @@ class Collector(ABC):
         """
         self._repository = repository
         self._rounding_digits = rounding_digits
-        self._nauty = nauty if nauty is not None else Nauty()
+        self._nauty = nauty if nauty is not None else get_default_nauty()
 
     def collect_values(
             self,
             graph: nx.Graph,
             iacm_data_only: bool,
-            shells: List[int]
+            shells: List[int],
+            atoms: Optional[AtomDataList]=None
             ) -> Dict[Atom, Tuple[ChargeList, WeightList]]:
         """Collect charges for a graph's atoms.
 
@@ -59,6 +143,9 @@ class Collector(ABC):
             iacm_data_only: If true, do not fall back to plain elements
             shells: A list of shell sizes to try, in order, until a \
                     match is found.
+            atoms: The atoms of the graph and their attributes, as \
+                    returned by graph.nodes(data=True). Taken from \
+                    the graph if not given.
 
         Raises:
             AssignmentError: If no charges could be found for at least \
@@ -72,34 +159,123 @@ class Collector(ABC):
                     which represents the neighborhood of the atom
         """
         charges = dict()
-        no_vals = list()
         keys = dict()
+        canonical_keys = dict()     # type: Dict[Tuple[Atom, FrozenSet[Atom], str], str]
+        collected = dict()          # type: Dict[Tuple[int, int, str], Tuple[ChargeList, WeightList]]
+
+        charges_iacm = self._repository.charges_iacm
+        charges_elem = self._repository.charges_elem
+        # charges per shell, or None if the repository lacks the shell
+        shell_charges_iacm = {shell_size: charges_iacm.get(shell_size) for shell_size in shells}
+        shell_charges_elem = {shell_size: charges_elem.get(shell_size) for shell_size in shells}
+
+        if atoms is None:
+            atoms = list(graph.nodes(data=True))
+        has_iacm = {atom: 'iacm' in atom_data for atom, atom_data in atoms}
+
+        # Try the shells in order, for all atoms that have no charges yet
+        # at once, so that their neighborhoods are canonized in one batch.
+        remaining = [atom for atom, _ in atoms]
+        for shell_size in shells:
+            if not remaining:
+                break
+
+            shell_charges = shell_charges_iacm[shell_size]
+            if shell_charges is not None:
+                iacm_atoms = [atom for atom in remaining if has_iacm[atom]]
+                iacm_keys = self._canonize_neighborhoods(graph, iacm_atoms, shell_size, 'iacm', canonical_keys)
+                for atom, key in zip(iacm_atoms, iacm_keys):
+                    if key in shell_charges:
+                        charges[atom] = self._collect_once(charges_iacm, shell_size, key, collected)
+                        keys[atom] = key
+
+            shell_charges = shell_charges_elem[shell_size]
+            if shell_charges is not None:
+                elem_atoms = [atom for atom in remaining if not has_iacm[atom] or
+                              (not atom in charges and not iacm_data_only)]
+                elem_keys = self._canonize_neighborhoods(graph, elem_atoms, shell_size, 'atom_type', canonical_keys)
+                for atom, key in zip(elem_atoms, elem_keys):
+                    if key in shell_charges:
+                        charges[atom] = self._collect_once(charges_elem, shell_size, key, collected)
+                        keys[atom] = key
+
+            remaining = [atom for atom in remaining if not atom in charges]
+
+        self._handle_error(remaining, shells)
+
+        # return atoms in graph order, regardless of the shell they matched at
+        charges = {atom: charges[atom] for atom, _ in atoms}
+        keys = {atom: keys[atom] for atom, _ in atoms}
+        return charges, keys
 
-        for atom in graph.nodes():
-            for shell_size in shells:
-                atom_has_iacm = 'iacm' in graph.node[atom]
-
-                if atom_has_iacm:
-                    if shell_size in self._repository.charges_iacm:
-                        key = self._nauty.canonize_neighborhood(graph, atom, shell_size, 'iacm')
-                        if key in self._repository.charges_iacm[shell_size]:
-                            charges[atom] = self._collect(self._repository.charges_iacm, shell_size, key)
-                            keys[atom] = key
-
-                if not atom_has_iacm or (not atom in charges and not iacm_data_only):
-                    if shell_size in self._repository.charges_elem:
-                        key = self._nauty.canonize_neighborhood(graph, atom, shell_size, 'atom_type')
-                        if key in self._repository.charges_elem[shell_size]:
-                            charges[atom] = self._collect(self._repository.charges_elem, shell_size, key)
-                            keys[atom] = key
-
-                if atom in charges:
-                    break
+    def _canonize_neighborhoods(
+            self,
+            graph: nx.Graph,
+            atoms: List[Atom],
+            shell_size: int,
+            color_key: str,
+            canonical_keys: Dict[Tuple[Atom, FrozenSet[Atom], str], str]
+            ) -> List[str]:
+        """Calculate canonical keys for the neighborhoods of atoms.
+
+        Canonical keys are memoized in canonical_keys by the atom, the \
+        atoms in its neighborhood and the color key. Shells reaching \
+        beyond the edge of the molecule yield the same neighborhood, \
+        so nauty is called only once for them. Neighborhoods not seen \
+        before are sent to nauty in a single batch.
+
+        Args:
+            graph: The graph containing the atoms
+            atoms: The core atoms of the neighborhoods
+            shell_size: Shell size k
+            color_key: Attribute key to use to determine atom color
+            canonical_keys: Previously calculated canonical keys
+
+        Returns:
+            The canonical keys of the atoms' k-neighborhoods, in order.
+        """
+        cache_keys = list()
+        for atom in atoms:
+            if shell_size > 0:
+                fragment = frozenset(bfs_nodes(graph, atom, max_depth=shell_size))
             else:
-                no_vals.append(atom)
+                fragment = frozenset([atom])
+            cache_keys.append((atom, fragment, color_key))
 
-        self._handle_error(no_vals, shells)
-        return charges, keys
+        missing = [cache_key for cache_key in cache_keys if cache_key not in canonical_keys]
+        new_keys = self._nauty.canonize_all(
+                [(graph.subgraph(fragment), atom) for atom, fragment, _ in missing], color_key=color_key)
+        canonical_keys.update(zip(missing, new_keys))
+
+        return [canonical_keys[cache_key] for cache_key in cache_keys]
+
+    def _collect_once(
+            self,
+            chargeset: EitherChargeSet,
+            shell_size: int,
+            key: str,
+            collected: Dict[Tuple[int, int, str], Tuple[ChargeList, WeightList]]
+            ) -> Tuple[ChargeList, WeightList]:
+        """Collect charges for a key, reusing earlier results.
+
+        Atoms with equivalent neighborhoods share a key, so within a \
+        molecule, the charges for each key need to be processed only \
+        once.
+
+        Args:
+            chargeset: A dictonary index by shell_size and key that holds the charge values
+            shell_size: Shell size k
+            key: Hash of the atom's k-neighborhood
+            collected: Results of previous calls, by chargeset, \
+                    shell size and key
+
+        Returns:
+            A tuple of the processed charges and associated weights.
+        """
+        collected_key = (id(chargeset), shell_size, key)
+        if collected_key not in collected:
+            collected[collected_key] = self._collect(chargeset, shell_size, key)
+        return collected[collected_key]
 
     @abstractmethod
     def _collect(
@@ -192,7 +368,7 @@ class MeanCollector(Collector):
             A tuple of the containing the mean charge and an arbitrary weight (1).
         """
         values = chargeset[shell_size][key]
-        mean_charge = round(float(np.mean(values)), self._rounding_digits)
+        mean_charge = round(fsum(values) / len(values), self._rounding_digits)
         return [mean_charge], [1.0]
 
 
@@ -295,7 +471,7 @@ class HistogramCollector(Collector):
         """
         values = chargeset[shell_size][key]
         hist = self._calculate_histogram(values, self._max_bins)
-        return self._score_hist(hist, float(np.mean(values)))
+        return self._score_hist(hist, fsum(values) / len(values))
 
     def _handle_error(
             self,
@@ -355,35 +531,15 @@ class HistogramCollector(Collector):
 
         median_charge = round_to(median(charges), grain)
 
-        # subtract one because we start the loop with an increment
+        # start with the F-D width, and widen from there
         spacing = round_to(fd_width, grain) / grain
-        num_bins = max_bins + 1
-        while num_bins > max_bins:
-            step = grain * spacing
-
-            # align center bin to median and find edge bin centers
-            min_charge_bin = (median_charge -
-                    round_to(median_charge - min(charges), step))
-            max_charge_bin = (median_charge +
-                    round_to(max(charges) - median_charge, step))
-
-            # add half a step to include the last value
-            bin_centers = np.arange(min_charge_bin, max_charge_bin + 0.5*step, step)
-
-            min_bin_edge = min_charge_bin - 0.5*step
-            max_bin_edge = max_charge_bin + 0.5*step
-            # add half a step to include the last value
-            bin_edges = np.arange(min_bin_edge, max_bin_edge + 0.5*step, step)
-            # extend a bit to compensate for round-off error
-            bin_edges[-1] += 1e-15
-
-            counts, _ = np.histogram(charges, bins=bin_edges)
-            num_bins = np.count_nonzero(counts)
-            spacing += 1
-
-        nonzero_bins = np.nonzero(counts)
-        counts = counts[nonzero_bins].tolist()
-        bin_centers = bin_centers[nonzero_bins].tolist()
+
+        bin_centers, counts = _histogram_kernel(
+                np.asarray(charges, dtype=np.float64), float(grain), max_bins,
+                float(median_charge), float(spacing))
+
+        bin_centers = bin_centers.tolist()
+        counts = counts.tolist()
 
         return bin_centers, counts
 
@@ -1,6 +1,7 @@
 import hashlib
 import os
 import subprocess
+import threading
 from itertools import groupby
 from typing import Any, Dict, Tuple, List
 
@@ -22,6 +23,31 @@ Edges = List[Tuple[int, int]]
 AdjacencyLists = List[Tuple[int, List[int]]]
 """Dreadnaut's way of describing a graph's topology, maps each node to its neighbors."""
 
+_default_nauty = None
+_default_nauty_pid = None
+_default_nauty_lock = threading.Lock()
+
+
+def get_default_nauty() -> 'Nauty':
+    """Return a Nauty instance shared by everything in this process.
+
+    The instance is created on first use. Chargers and collectors \
+    that are not given a Nauty instance use this one, so that they \
+    do not each start their own dreadnaut process. A forked child \
+    process gets its own instance, rather than sharing the parent's \
+    dreadnaut.
+
+    Returns:
+        The default Nauty instance.
+    """
+    global _default_nauty, _default_nauty_pid
+    with _default_nauty_lock:
+        if _default_nauty is None or _default_nauty_pid != os.getpid():
+            _default_nauty = Nauty()
+            _default_nauty_pid = os.getpid()
+        return _default_nauty
+
+
 class Nauty:
     """Manages a dreadnaut process and communicates with it.
 
@@ -35,6 +61,8 @@ class Nauty:
                              'anu.edu.au/~bdm/nauty/)?' % executable)
         self.exe = executable
         self.__process = None
+        # serializes exchanges with dreadnaut, for sharing between threads
+        self.__lock = threading.Lock()
         self.__ensure_dreadnaut_running()
 
     def __del__(self):
@@ -112,20 +140,46 @@ class Nauty:
         Returns:
             A string unique to the graph.
         """
-        node_colors = list()
-        for node, color_str in graph.nodes(data=color_key):
-            node_colors.append((node == core, color_str))
+        return self.canonize_all([(graph, core)], color_key=color_key)[0]
 
-        nauty_input = self.__make_nauty_input(graph, node_colors)
+    def canonize_all(self, graphs: List[Tuple[nx.Graph, Any]], color_key='atom_type') -> List[str]:
+        """Calculate canonical keys for several molecular graphs.
 
-        self.__ensure_dreadnaut_running()
-        nauty_output = self.__communicate(nauty_input)
+        This does the same as canonize() for each graph, but sends \
+        all graphs to dreadnaut at once and reads back all results, \
+        rather than waiting for dreadnaut once per graph.
 
-        canonical_node_ids, adjacency_lists = self.__parse_nauty_output(nauty_output)
-        canonical_node_colors = self.__canonical_node_colors(canonical_node_ids, node_colors)
-        canonical_edges = self.__canonical_edges(adjacency_lists)
-        key = self.__make_hash(canonical_node_colors, canonical_edges)
-        return key
+        Args:
+            graphs: A list of pairs of an atomic (sub)graph and its \
+                    core node, which may be None.
+            color_key: Attribute key to use to determine atom color.
+
+        Returns:
+            A list of strings unique to the graphs, in the same order.
+        """
+        if len(graphs) == 0:
+            return list()
+
+        all_node_colors = list()
+        nauty_inputs = list()
+        for graph, core in graphs:
+            node_colors = list()
+            for node, color_str in graph.nodes(data=color_key):
+                node_colors.append((node == core, color_str))
+            all_node_colors.append(node_colors)
+            nauty_inputs.append(self.__make_nauty_input(graph, node_colors))
+
+        with self.__lock:
+            self.__ensure_dreadnaut_running()
+            nauty_outputs = self.__communicate(''.join(nauty_inputs), len(nauty_inputs))
+
+        keys = list()
+        for nauty_output, node_colors in zip(nauty_outputs, all_node_colors):
+            canonical_node_ids, adjacency_lists = self.__parse_nauty_output(nauty_output)
+            canonical_node_colors = self.__canonical_node_colors(canonical_node_ids, node_colors)
+            canonical_edges = self.__canonical_edges(adjacency_lists)
+            keys.append(self.__make_hash(canonical_node_colors, canonical_edges))
+        return keys
 
     def __ensure_dreadnaut_running(self):
         """Starts dreadnaut if it isn't running."""
@@ -139,24 +193,53 @@ class Nauty:
                 close_fds=True
             )
 
-    def __communicate(self, input_str: str) -> str:
+    def __communicate(self, input_str: str, num_graphs: int=1) -> List[str]:
         """Sends input to a running dreadnaut, and returns output.
 
+        Batches of graphs are written from a separate thread, so that \
+        dreadnaut cannot block on a full output pipe while we are \
+        still writing input.
+
         Args:
             input_str: The input to send to the dreadnaut process.
+            num_graphs: The number of graphs described by input_str.
 
         Returns:
-            The corresponding output produced by dreadnaut.
+            The corresponding output produced by dreadnaut, one string \
+                    per graph.
         """
-        self.__process.stdin.write(input_str.encode())
-        self.__process.stdin.flush()
-
-        out = self.__process.stdout.read(1000)
-        while not b'END' in out:
-            out += self.__process.stdout.read(1000)
+        def write_input() -> None:
+            self.__process.stdin.write(input_str.encode())
+            self.__process.stdin.flush()
 
-        return out.strip().decode()
+        if num_graphs > 1:
+            writer = threading.Thread(target=write_input)
+            writer.start()
+        else:
+            writer = None
+            write_input()
 
+        chunks = list()
+        tail = b''
+        num_ends = 0
+        try:
+            while num_ends < num_graphs:
+                data = self.__process.stdout.read(65536)
+                if not data:
+                    raise RuntimeError('Dreadnaut exited unexpectedly.')
+                chunks.append(data)
+                # an END may straddle several short reads, the tail is
+                # too short to hold a whole one
+                data_with_tail = tail + data
+                num_ends += data_with_tail.count(b'END')
+                tail = data_with_tail[-2:]
+        finally:
+            if writer is not None:
+                writer.join()
+        out = b''.join(chunks)
+
+        outputs = out.strip().decode().split('END')
+        return [output.strip() + '\nEND' for output in outputs[:num_graphs]]
 
     def __make_nauty_input(
             self,
@@ -23,6 +23,9 @@ if not NAUTY_EXC:
 ILP_SOLVER_MAX_SECONDS = 60
 """Time limit for the ILP solver in seconds."""
 
+ILP_SOLVER_BACKEND = 'pulp'
+"""Default backend for the ILP solver, 'pulp' or 'highs'."""
+
 DEFAULT_TOTAL_CHARGE = 0
 """Default target total charge."""
 
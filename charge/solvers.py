@@ -4,14 +4,72 @@ from time import perf_counter
 from typing import Dict, Tuple, List
 
 import networkx as nx
+import numpy as np
 from pulp import LpVariable, LpInteger, LpMaximize, LpProblem, LpStatusOptimal, CPLEX_CMD, GUROBI_CMD, PULP_CBC_CMD, \
-    GLPK_CMD, COIN_CMD
+    GLPK_CMD, COIN_CMD, lpSum
 
 from collections import defaultdict
 
+try:
+    import scipy
+    from scipy.optimize import Bounds, LinearConstraint, milp
+    from scipy.sparse import csr_matrix
+
+    # The HiGHS bundled with older SciPy releases can abort the
+    # interpreter or report infeasible solutions as optimal.
+    if tuple(int(part) for part in scipy.__version__.split('.')[:2]) < (1, 15):
+        milp = None
+except ImportError:
+    milp = None
+
 from charge.charge_types import Atom, ChargeList, WeightList
-from charge.settings import DEFAULT_TOTAL_CHARGE_DIFF, ROUNDING_DIGITS, ILP_SOLVER_MAX_SECONDS
-from charge.util import AssignmentError
+from charge.settings import DEFAULT_TOTAL_CHARGE_DIFF, ROUNDING_DIGITS, ILP_SOLVER_MAX_SECONDS, ILP_SOLVER_BACKEND
+from charge.util import AssignmentError, njit
+
+
+@njit('Tuple((float64[:], int16[:, :]))(int32[:], float64[:], int64[:], int64)', cache=True)
+def _dp_kernel(
+        weights: np.ndarray,
+        profits: np.ndarray,
+        offsets: np.ndarray,
+        upper: int
+        ) -> Tuple[np.ndarray, np.ndarray]:
+    """Fill the DP table for the Multiple Choice Knapsack Problem.
+
+    See DPSolver.solve_partial_charges(). This is compiled with numba \
+    when the module is imported if it is available, and runs as plain \
+    NumPy otherwise.
+
+    Args:
+        weights: The integer weights of the items of all sets
+        profits: The profits of the items of all sets
+        offsets: The index of the first item of each set in weights \
+                and profits, followed by the total number of items
+        upper: The capacity of the knapsack
+
+    Returns:
+        The maximum profit for each capacity, and for each set and \
+        capacity the index of the item chosen from that set.
+    """
+    num_sets = offsets.shape[0] - 1
+    dp = np.full(upper + 1, -np.inf)
+    dp[0] = 0.0
+    choice = np.zeros((num_sets, upper + 1), dtype=np.int16)
+    for k in range(num_sets):
+        new_dp = np.full(upper + 1, -np.inf)
+        new_choice = np.full(upper + 1, -1, dtype=np.int32)
+        for j in range(offsets[k], offsets[k + 1]):
+            w = weights[j]
+            if w > upper:
+                continue
+            # the first item with the maximum profit wins
+            candidates = dp[:upper + 1 - w] + profits[j]
+            better = (candidates > new_dp[w:]) | (new_choice[w:] == -1)
+            new_dp[w:] = np.where(better, candidates, new_dp[w:])
+            new_choice[w:] = np.where(better, np.int32(j - offsets[k]), new_choice[w:])
+        dp = new_dp
+        choice[k, :] = new_choice.astype(np.int16)
+    return dp, choice
 
 
 class Solver(ABC):
@@ -119,7 +177,8 @@ class ILPSolver(Solver):
 
     def __init__(self,
                  rounding_digits: int=ROUNDING_DIGITS,
-                 max_seconds: int=ILP_SOLVER_MAX_SECONDS
+                 max_seconds: int=ILP_SOLVER_MAX_SECONDS,
+                 backend: str=ILP_SOLVER_BACKEND
                  ) -> None:
         """Create an ILPSolver.
 
@@ -127,10 +186,25 @@ class ILPSolver(Solver):
             rounding_digits: Number of digits to round the charges to.
             max_seconds: Maximum run-time to spend searching for a \
                     solution
+            backend: The ILP solver to use, either 'pulp' to use the \
+                    best solver available through the pulp library, \
+                    or 'highs' to use HiGHS through scipy.optimize.milp \
+                    (requires SciPy 1.15 or later).
         """
         self.__rounding_digits = rounding_digits
-
-        if CPLEX_CMD().available():
+        self.__max_seconds = max_seconds
+        self.__backend = backend
+        # the structure of the last HiGHS model, see __solve_highs
+        self.__highs_model = None
+
+        if backend == 'highs':
+            if milp is None:
+                raise RuntimeError('The highs backend requires'
+                        ' SciPy 1.15 or later.')
+        elif backend != 'pulp':
+            raise ValueError('Unknown ILP backend {}, use pulp or'
+                    ' highs.'.format(backend))
+        elif CPLEX_CMD().available():
             self.__solver = CPLEX_CMD(timelimit=max_seconds)
         elif GUROBI_CMD().available():
             self.__solver = GUROBI_CMD(options={'timeLimit':max_seconds})
@@ -162,8 +236,8 @@ class ILPSolver(Solver):
 
         This solver formulates the epsilon-Multiple Choice Knapsack \
         Problem as an Integer Linear Programming problem and then uses \
-        a generic ILP solver from the pulp library to produce optimised \
-        charges.
+        a generic ILP solver from the pulp library or HiGHS to produce \
+        optimised charges.
 
         Args:
             graph: The molecule graph to solve charges for.
@@ -187,24 +261,63 @@ class ILPSolver(Solver):
             profits[k] = frequencies
             pos_total -= min(charges)
 
+        if self.__backend == 'highs':
+            solution, solutionTime = self.__solve_highs(
+                    idx, weights, profits, total_charge, total_charge_diff)
+        else:
+            solution, solutionTime = self.__solve_pulp(
+                    idx, weights, profits, total_charge, total_charge_diff)
+
+        profit = 0
+        charge = 0
+        for k, i in enumerate(solution):
+            graph.nodes[atom_idx[k]]['partial_charge'] = weights[k][i]
+            graph.nodes[atom_idx[k]]['score'] = profits[k][i]
+            profit += profits[k][i]
+            charge += graph.nodes[atom_idx[k]]['partial_charge']
+
+        graph.graph['total_charge'] = round(charge, self.__rounding_digits)
+        graph.graph['score'] = profit
+        graph.graph['time'] = solutionTime
+        graph.graph['items'] = sum(len(indices) for indices in idx)
+        graph.graph['scaled_capacity'] = pos_total + total_charge_diff
+
+    def __solve_pulp(
+            self,
+            idx: List[List[Tuple[int, int]]],
+            weights: Dict[int, ChargeList],
+            profits: Dict[int, WeightList],
+            total_charge: int,
+            total_charge_diff: float
+            ) -> Tuple[List[int], float]:
+        """Solve the ILP problem using the pulp library.
+
+        Args:
+            idx: For each set, the (set, item) indices of its items
+            weights: For each set, the charges of its items
+            profits: For each set, the scores of its items
+            total_charge: The total charge of the molecule
+            total_charge_diff: Maximum allowed deviation from the total charge
+
+        Returns:
+            The index of the selected item for each set, and the time \
+            it took to solve the problem.
+        """
         x = LpVariable.dicts('x', itertools.chain.from_iterable(idx), lowBound=0, upBound=1, cat=LpInteger)
 
         charging_problem = LpProblem("Atomic Charging Problem", LpMaximize)
 
         # maximize profits
-        charging_problem += sum([profits[k][i] * x[(k, i)] for k, i in itertools.chain.from_iterable(idx)])
+        charging_problem += lpSum([profits[k][i] * x[(k, i)] for k, i in itertools.chain.from_iterable(idx)])
 
         # select exactly one item per set
         for indices in idx:
-            charging_problem += sum([x[(k, i)] for k, i in indices]) == 1
+            charging_problem += lpSum([x[(k, i)] for k, i in indices]) == 1
 
         # total charge difference
-        charging_problem +=\
-            sum([weights[k][i] * x[(k, i)] for k, i in itertools.chain.from_iterable(idx)]) - total_charge\
-            <= total_charge_diff
-        charging_problem +=\
-            sum([weights[k][i] * x[(k, i)] for k, i in itertools.chain.from_iterable(idx)]) - total_charge\
-            >= -total_charge_diff
+        charge = lpSum([weights[k][i] * x[(k, i)] for k, i in itertools.chain.from_iterable(idx)])
+        charging_problem += charge - total_charge <= total_charge_diff
+        charging_problem += charge - total_charge >= -total_charge_diff
 
         solutionTime = -perf_counter()
         try:
@@ -218,22 +331,96 @@ class ILPSolver(Solver):
             raise AssignmentError('Could not solve ILP problem. Please retry'
                     ' with a SimpleCharger')
 
-        solution = []
-        profit = 0
-        charge = 0
+        solution = [0] * len(idx)
         for k, i in itertools.chain.from_iterable(idx):
             if x[(k, i)].value() == 1.0:
-                graph.nodes[atom_idx[k]]['partial_charge'] = weights[k][i]
-                graph.nodes[atom_idx[k]]['score'] = profits[k][i]
-                solution.append(i)
-                profit += profits[k][i]
-                charge += graph.nodes[atom_idx[k]]['partial_charge']
+                solution[k] = i
+        return solution, solutionTime
 
-        graph.graph['total_charge'] = round(charge, self.__rounding_digits)
-        graph.graph['score'] = profit
-        graph.graph['time'] = solutionTime
-        graph.graph['items'] = len(x)
-        graph.graph['scaled_capacity'] = pos_total + total_charge_diff
+    def __solve_highs(
+            self,
+            idx: List[List[Tuple[int, int]]],
+            weights: Dict[int, ChargeList],
+            profits: Dict[int, WeightList],
+            total_charge: int,
+            total_charge_diff: float
+            ) -> Tuple[List[int], float]:
+        """Solve the ILP problem using HiGHS through scipy.optimize.milp.
+
+        The parts of the model that only depend on the number of items \
+        in each set are kept, and reused for the next molecule with \
+        the same structure. Only the profits and charges are filled in \
+        anew then.
+
+        Args:
+            idx: For each set, the (set, item) indices of its items
+            weights: For each set, the charges of its items
+            profits: For each set, the scores of its items
+            total_charge: The total charge of the molecule
+            total_charge_diff: Maximum allowed deviation from the total charge
+
+        Returns:
+            The index of the selected item for each set, and the time \
+            it took to solve the problem.
+        """
+        variables = list(itertools.chain.from_iterable(idx))
+        num_sets = len(idx)
+        num_vars = len(variables)
+
+        # Read the cached model once, another thread may replace it.
+        set_sizes = tuple(len(indices) for indices in idx)
+        model = self.__highs_model
+        if model is None or model[0] != set_sizes:
+            # The constraint matrices are built sparse straight from the
+            # (row, col) coordinates, each variable has one entry.
+            cols = np.arange(num_vars)
+
+            # select exactly one item per set
+            selection = csr_matrix(
+                    (np.ones(num_vars), (np.array([k for k, _ in variables], dtype=np.int64), cols)),
+                    shape=(num_sets, num_vars))
+
+            charge_indptr = np.array([0, num_vars], dtype=np.int64)
+            model = (
+                    set_sizes, selection, cols, charge_indptr,
+                    np.ones(num_vars), Bounds(0.0, 1.0))
+            self.__highs_model = model
+
+        _, selection, cols, charge_indptr, integrality, bounds = model
+
+        # milp minimizes, so negate the profits
+        c = np.array([-profits[k][i] for k, i in variables], dtype=np.float64)
+
+        # total charge difference
+        charge_row = csr_matrix(
+                (np.array([weights[k][i] for k, i in variables], dtype=np.float64), cols, charge_indptr),
+                shape=(1, num_vars))
+
+        constraints = [
+                LinearConstraint(selection, 1.0, 1.0),
+                LinearConstraint(
+                    charge_row,
+                    total_charge - total_charge_diff,
+                    total_charge + total_charge_diff)]
+
+        solutionTime = -perf_counter()
+        result = milp(
+                c, constraints=constraints,
+                integrality=integrality,
+                bounds=bounds,
+                options={'time_limit': self.__max_seconds})
+        solutionTime += perf_counter()
+
+        # status 0 means an optimal solution was found
+        if result.status != 0 or result.x is None:
+            raise AssignmentError('Could not solve ILP problem. Please retry'
+                    ' with a SimpleCharger')
+
+        solution = [0] * num_sets
+        for j, (k, i) in enumerate(variables):
+            if result.x[j] > 0.5:
+                solution[k] = i
+        return solution, solutionTime
 
 class SymmetricILPSolver(Solver):
     """An optimizing solver using Integer Linear Programming.
@@ -320,19 +507,16 @@ class SymmetricILPSolver(Solver):
         charging_problem = LpProblem("Atomic Charging Problem", LpMaximize)
 
         # maximize profits
-        charging_problem += sum([profits[k][i] * x[(k, i)] for k, i in itertools.chain.from_iterable(idx)])
+        charging_problem += lpSum([profits[k][i] * x[(k, i)] for k, i in itertools.chain.from_iterable(idx)])
 
         # select exactly one item per set
         for indices in idx:
-            charging_problem += sum([x[(k, i)] for k, i in indices]) == 1
+            charging_problem += lpSum([x[(k, i)] for k, i in indices]) == 1
 
         # total charge difference
-        charging_problem +=\
-            sum([weights[k][i] * x[(k, i)] for k, i in itertools.chain.from_iterable(idx)]) - total_charge\
-            <= total_charge_diff
-        charging_problem +=\
-            sum([weights[k][i] * x[(k, i)] for k, i in itertools.chain.from_iterable(idx)]) - total_charge\
-            >= -total_charge_diff
+        charge = lpSum([weights[k][i] * x[(k, i)] for k, i in itertools.chain.from_iterable(idx)])
+        charging_problem += charge - total_charge <= total_charge_diff
+        charging_problem += charge - total_charge >= -total_charge_diff
 
         #identical neighborhood charge conditions
         neighborhoodclasses = self.compute_atom_neighborhood_classes(atom_idx, keydict)
@@ -459,19 +643,16 @@ class SymmetricRelaxedILPSolver(Solver):
         charging_problem = LpProblem("Atomic Charging Problem", LpMaximize)
 
         # maximize profits
-        charging_problem += sum([profits[k][i] * x[(k, i)] for k, i in itertools.chain.from_iterable(idx)])
+        charging_problem += lpSum([profits[k][i] * x[(k, i)] for k, i in itertools.chain.from_iterable(idx)])
 
         # select exactly one item per set
         for indices in idx:
-            charging_problem += sum([x[(k, i)] for k, i in indices]) == 1
+            charging_problem += lpSum([x[(k, i)] for k, i in indices]) == 1
 
         # total charge difference
-        charging_problem +=\
-            sum([weights[k][i] * x[(k, i)] for k, i in itertools.chain.from_iterable(idx)]) - total_charge\
-            <= total_charge_diff
-        charging_problem +=\
-            sum([weights[k][i] * x[(k, i)] for k, i in itertools.chain.from_iterable(idx)]) - total_charge\
-            >= -total_charge_diff
+        charge = lpSum([weights[k][i] * x[(k, i)] for k, i in itertools.chain.from_iterable(idx)])
+        charging_problem += charge - total_charge <= total_charge_diff
+        charging_problem += charge - total_charge >= -total_charge_diff
 
         #identical neighborhood charge conditions
         neighborhoodclasses = self.compute_atom_neighborhood_classes(atom_idx, keydict)
@@ -552,8 +733,8 @@ class DPSolver(Solver):
 
         This solver uses Dynamic Programming to solve the \
         epsilon-Multiple Choice Knapsack Problem. This is the Python \
-        version of the algorithm, see CDPSolver for a faster \
-        implementation.
+        version of the algorithm, which is compiled with numba if it \
+        is installed. See CDPSolver for the C implementation.
 
         Args:
             graph: The molecule graph to solve charges for.
@@ -600,29 +781,22 @@ class DPSolver(Solver):
             raise AssignmentError('Could not solve DP problem. Please retry'
                                   ' with a SimpleCharger')
 
-        # init DP and traceback tables
-        dp = [0] + [-float('inf')] * upper
-        tb = [[] for _ in range(upper + 1)]
+        if any(len(items_l) > np.iinfo(np.int16).max for items_l in items):
+            raise AssignmentError('Too many charges for an atom to solve'
+                    ' the DP problem. Please retry with fewer bins.')
+
+        # flatten the sets into arrays for the DP kernel, the weights
+        # are offsets on the charge grid, so they fit in 32 bits
+        weights = np.array([item[1] for items_l in items for item in items_l], dtype=np.int32)
+        profits = np.array([item[2] for items_l in items for item in items_l], dtype=np.float64)
+        offsets = np.cumsum([0] + [len(items_l) for items_l in items], dtype=np.int64)
 
         # DP
-        # iterate over all sets
-        for items_l in items:
-            # iterate over all capacities
-            for d in range(upper, -1, -1):
-                try:
-                    # find max. profit with capacity i over all items j in set k
-                    idx, dp[d] = max(
-                        ((item[0], dp[d - item[1]] + item[2]) for item in items_l if d - item[1] >= 0),
-                        key=lambda x: x[1]
-                    )
-                    # copy old traceback indices and add new index to traceback
-                    if dp[d] >= 0:
-                        tb[d] = tb[d - items_l[idx][1]] + [idx]
-                except ValueError:
-                    dp[d] = -float('inf')
+        dp, choice = _dp_kernel(weights, profits, offsets, upper)
 
         # find max profit
-        max_pos, max_val = max(enumerate(dp[lower:upper + 1]), key=lambda x: x[1])
+        max_pos = int(np.argmax(dp[lower:upper + 1]))
+        max_val = dp[lower + max_pos]
 
         solutionTime += perf_counter()
 
@@ -630,7 +804,12 @@ class DPSolver(Solver):
             raise AssignmentError('Could not solve DP problem. Please retry'
                     ' with a SimpleCharger')
 
-        solution = tb[lower + max_pos]
+        # trace back the chosen items
+        solution = [0] * len(items)
+        d = lower + max_pos
+        for k in range(len(items) - 1, -1, -1):
+            solution[k] = int(choice[k, d])
+            d -= items[k][solution[k]][1]
 
         charge = 0
         score = 0
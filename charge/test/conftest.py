@@ -4,6 +4,11 @@ from pathlib import Path
 import networkx as nx
 import pytest
 
+try:
+    from rdkit import Chem
+except ImportError:
+    Chem = None
+
 from charge.bond_type import BondType
 from charge.nauty import Nauty
 from charge.repository import _VersioningList
@@ -19,7 +24,7 @@ def ref_graph_attributes():
         }
 
 
-@pytest.fixture
+@pytest.fixture(scope='session')
 def ref_graph_nodes():
     return [(1, {'iacm': 'C', 'atom_type': 'C', 'label': 'C1', 'charge_group': 0}),
             (2, {'iacm': 'HC', 'atom_type': 'H', 'label': 'H1', 'charge_group': 0}),
@@ -28,7 +33,7 @@ def ref_graph_nodes():
             (5, {'iacm': 'HC', 'atom_type': 'H', 'label': 'H4', 'charge_group': 0})]
 
 
-@pytest.fixture
+@pytest.fixture(scope='session')
 def ref_graph_edges():
     return [(1, 2, {'bond_type': BondType.UNKNOWN}),
             (1, 3, {'bond_type': BondType.UNKNOWN}),
@@ -52,7 +57,7 @@ def plain_ref_graph(ref_graph):
     return graph
 
 
-@pytest.fixture
+@pytest.fixture(scope='session')
 def ref_graph_lgf():
     return ('@nodes\n'
             'label\tlabel2\tatomType\tinitColor\t\n'
@@ -69,7 +74,7 @@ def ref_graph_lgf():
             '1\t5\t3\t\n')
 
 
-@pytest.fixture
+@pytest.fixture(scope='session')
 def ref_graph_gml():
     return (
             'graph [\n'
@@ -127,7 +132,7 @@ def ref_graph_gml():
             ']')
 
 
-@pytest.fixture
+@pytest.fixture(scope='session')
 def ref_graph_itp():
     return (
             '[ atoms ]\n'
@@ -145,9 +150,10 @@ def ref_graph_itp():
             '    1    5\n')
 
 
-@pytest.fixture
+@pytest.fixture(scope='session')
 def ref_graph_rdkit(ref_graph_nodes, ref_graph_edges):
-    from rdkit import Chem
+    if Chem is None:
+        pytest.skip('rdkit is not installed')
     rdmol = Chem.RWMol()
 
     rdmol.SetDoubleProp('group_charge_0', 0.0)
@@ -185,14 +191,15 @@ def ref_graph_rdkit(ref_graph_nodes, ref_graph_edges):
     return rdmol
 
 
-@pytest.fixture
+@pytest.fixture(scope='session')
 def ref_graph_nodes_shifted(ref_graph_nodes):
     return [(v-1, data) for v, data in ref_graph_nodes]
 
 
-@pytest.fixture
+@pytest.fixture(scope='session')
 def ref_graph_edges_shifted(ref_graph_edges):
-    from rdkit import Chem
+    if Chem is None:
+        pytest.skip('rdkit is not installed')
     return [(u - 1, v - 1, {**{'rdkit_bond_type': Chem.BondType.UNSPECIFIED}, **data})
                 for u, v, data in ref_graph_edges]
 
@@ -398,6 +405,20 @@ class MockVersioningRepository:
         self.charges_elem = dict()
 
 
+class MockShellFallbackRepository:
+    def __init__(self):
+        self.charges_iacm = {
+                0: dict(),
+                1: dict(),
+                2: dict(),
+                3: dict()
+                }
+
+        self.charges_elem = {
+                0: dummy_chargeset()
+                }
+
+
 @pytest.fixture
 def mock_repository():
     return MockRepository()
@@ -427,6 +448,18 @@ def mock_versioning_repository():
     return MockVersioningRepository()
 
 
+@pytest.fixture
+def mock_shell_fallback_repository():
+    return MockShellFallbackRepository()
+
+
+@pytest.fixture(params=['pulp', 'highs'])
+def ilp_backend(request):
+    if request.param == 'highs':
+        pytest.importorskip('scipy', minversion='1.15')
+    return request.param
+
+
 # fixtures for testing validation
 
 @pytest.fixture
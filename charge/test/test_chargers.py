@@ -1,5 +1,6 @@
 from math import log
 
+import networkx as nx
 import pytest
 
 from charge.chargers import CDPCharger, DPCharger, ILPCharger, MeanCharger, MedianCharger, ModeCharger, \
@@ -27,6 +28,60 @@ def test_mean_charger(mock_repository, ref_graph):
     assert ref_graph.graph['score'] == pytest.approx(5.0)
 
 
+def test_shell_iterable(mock_repository, ref_graph):
+    charger = MeanCharger(mock_repository, 2)
+    charger.charge(ref_graph, 0, shell=(shell for shell in [2, 1, 0]))
+
+    for atom in ref_graph.nodes():
+        assert ref_graph.node[atom]['partial_charge'] == 0.34
+
+    with pytest.raises(TypeError):
+        charger.charge(ref_graph, 0, shell=1.5)
+
+
+def test_default_shells(mock_repository):
+    charger = MeanCharger(mock_repository, 2)
+    assert charger._Charger__get_default_shells() == [2, 1, 0]
+
+    mock_repository.charges_iacm[3] = mock_repository.charges_iacm[2]
+    assert charger._Charger__get_default_shells() == [3, 2, 1, 0]
+
+    # a replacement with the same number of shells
+    mock_repository.charges_iacm = {shell + 4: charges for shell, charges in mock_repository.charges_iacm.items()}
+    assert charger._Charger__get_default_shells() == [7, 6, 5, 4]
+
+
+def redistribute(charger, graph, total_charge, charges, scores):
+    for (_, data), charge, score in zip(graph.nodes(data=True), charges, scores):
+        data['partial_charge'] = charge
+        data['score'] = score
+    graph.graph['total_charge'] = round(sum(charges), 2)
+    graph.graph['score'] = sum(scores)
+    charger._Charger__add_redistributed_charges(graph, total_charge, list(graph.nodes(data=True)))
+    return [data['partial_charge_redist'] for _, data in graph.nodes(data=True)]
+
+
+def test_redistribution(mock_repository):
+    charger = MeanCharger(mock_repository, 2)
+    graph = nx.Graph()
+    graph.add_nodes_from([1, 2, 3])
+
+    # lower scores get larger adjustments
+    charges = redistribute(charger, graph, 0, [0.1, 0.2, -0.28], [1.0, 0.5, 0.25])
+    assert charges == [0.1, 0.19, -0.29]
+    assert graph.graph['total_charge_redist'] == 0.0
+
+    # ties round half to even, the rest goes to the least certain atom
+    charges = redistribute(charger, graph, 1, [0.125, -0.375, 0.625], [1.0, 1.0, 2.0])
+    assert charges == [0.38, -0.12, 0.74]
+    assert graph.graph['total_charge_redist'] == 1.0
+
+    # without scores, the whole error goes to the first atom
+    charges = redistribute(charger, graph, 0, [0.1, 0.2, 0.3], [0.0, 0.0, 0.0])
+    assert charges == [-0.5, 0.2, 0.3]
+    assert graph.graph['total_charge_redist'] == 0.0
+
+
 def test_iacmize(mock_repository, plain_ref_graph):
     charger = MeanCharger(mock_repository, 2)
     charger.charge(plain_ref_graph, 0, True)
@@ -90,8 +145,8 @@ def test_mode_charger(mock_repository, ref_graph):
     assert ref_graph.graph['score'] == pytest.approx(10.0)
 
 
-def test_ilp_charger(mock_methane_repository, ref_graph):
-    charger = ILPCharger(mock_methane_repository, 2, 10)
+def test_ilp_charger(mock_methane_repository, ref_graph, ilp_backend):
+    charger = ILPCharger(mock_methane_repository, 2, 10, backend=ilp_backend)
     charger.charge(ref_graph, 0)
 
     assert ref_graph.node[1]['partial_charge'] == pytest.approx(-0.52)
@@ -111,6 +166,11 @@ def test_ilp_charger(mock_methane_repository, ref_graph):
     assert ref_graph.graph['score'] == pytest.approx(4 * log(3) + log(4))
 
 
+def test_ilp_charger_unknown_backend(mock_methane_repository):
+    with pytest.raises(ValueError):
+        ILPCharger(mock_methane_repository, 2, 10, backend='nonsense')
+
+
 def test_symmetric_ilp_charger(mock_methane_repository, ref_graph):
     charger = SymmetricILPCharger(mock_methane_repository, 2, 10)
     charger.charge(ref_graph, 0)
@@ -3,6 +3,17 @@ from math import log
 import pytest
 
 from charge.collectors import AssignmentError, HistogramCollector, MeanCollector, CachingCollector
+from charge.nauty import Nauty
+
+
+class CountingNauty(Nauty):
+    def __init__(self):
+        super().__init__()
+        self.num_canonizations = 0
+
+    def canonize_all(self, graphs, *args, **kwargs):
+        self.num_canonizations += len(graphs)
+        return super().canonize_all(graphs, *args, **kwargs)
 
 
 def test_mean_collector(ref_graph, mock_repository):
@@ -46,6 +57,50 @@ def test_shell_size_order(ref_graph, mock_order_repository):
     assert means[1] == ([0.34], [1.0])
 
 
+def test_canonical_key_reuse(ref_graph, mock_shell_fallback_repository):
+    nauty = CountingNauty()
+    collector = MeanCollector(mock_shell_fallback_repository, 2, nauty)
+
+    means, _ = collector.collect_values(ref_graph, False, [3, 2, 1, 0])
+
+    assert means[1] == ([0.34], [1.0])
+    assert means[2] == ([0.34], [1.0])
+    # C: whole molecule for shells 3-1, itself, elem fallback
+    # H: whole molecule for shells 3-2, C-H, itself, elem fallback
+    assert nauty.num_canonizations == 3 + 4 * 4
+
+
+def test_collect_once_per_key(ref_graph, mock_repository):
+    collector = MeanCollector(mock_repository, 2)
+    num_collects = [0]
+    collect = collector._collect
+
+    def counting_collect(*args):
+        num_collects[0] += 1
+        return collect(*args)
+
+    collector._collect = counting_collect
+    means, _ = collector.collect_values(ref_graph, False, [1])
+
+    assert means[2] == ([0.34], [1.0])
+    assert means[5] == ([0.34], [1.0])
+    # the C, and the four equivalent Hs
+    assert num_collects[0] == 2
+
+
+def test_histogram_collector_elem_fallback(ref_graph, mock_shell_fallback_repository):
+    collector = HistogramCollector(mock_shell_fallback_repository, 2)
+
+    # the IACM tables have the shells, but not the keys
+    means, _ = collector.collect_values(ref_graph, False, [1, 0])
+
+    assert means[1][0] == pytest.approx([0.31, 0.46])
+    assert means[2][0] == pytest.approx([0.31, 0.46])
+
+    with pytest.raises(AssignmentError):
+        collector.collect_values(ref_graph, True, [1, 0])
+
+
 def test_histogram_collector(ref_graph, mock_repository):
     collector = HistogramCollector(mock_repository, 2)
 
@@ -80,6 +135,16 @@ def test_histogram_collector_max_bins(ref_graph, mock_repository):
     assert means[5][1] == pytest.approx([log(3.0)])
 
 
+def test_histogram_clustered_charges(mock_repository):
+    collector = HistogramCollector(mock_repository, 2)
+    charges = [-0.5, -0.5, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.4, 0.4]
+
+    centers, counts = collector._calculate_histogram(charges, 3)
+
+    assert centers == pytest.approx([-0.5, 0.0, 0.4])
+    assert counts == [2, 6, 2]
+
+
 def test_caching_collector0(ref_graph, mock_repository):
 
     collector = CachingCollector(MeanCollector(mock_repository, 2))
@@ -1,7 +1,7 @@
 import stat
 from pathlib import Path
 
-from charge.nauty import Nauty
+from charge.nauty import Nauty, get_default_nauty
 
 
 def test_create():
@@ -14,6 +14,12 @@ def test_create():
     assert not nauty._Nauty__process.poll()
 
 
+def test_default_nauty():
+    nauty = get_default_nauty()
+    assert isinstance(nauty, Nauty)
+    assert get_default_nauty() is nauty
+
+
 def test_canonize_neighborhood_graph_1(nauty, ref_graph):
     print(list(ref_graph.nodes(data=True)))
     key = nauty.canonize_neighborhood(ref_graph, 1, 0)
@@ -46,6 +52,30 @@ def test_canonize_neighborhood_different_core(nauty, ref_graph):
     key3 = nauty.canonize_neighborhood(ref_graph, 3, 3)
     assert key2 == key3
 
+def test_canonize_all(nauty, ref_graph):
+    graphs = [(ref_graph, atom) for atom in [1, 2, 3, 4, 5]] + [(ref_graph.subgraph([1, 2]), 2)]
+    keys = nauty.canonize_all(graphs, 'iacm')
+    ref_keys = [nauty.canonize(graph, 'iacm', core) for graph, core in graphs]
+    assert keys == ref_keys
+
+    assert nauty.canonize_all([]) == []
+
+class OneByteReader:
+    def __init__(self, stream):
+        self.stream = stream
+
+    def read(self, size=-1):
+        return self.stream.read(1)
+
+def test_canonize_all_short_reads(nauty, ref_graph):
+    graphs = [(ref_graph, atom) for atom in [1, 2, 3]]
+    ref_keys = nauty.canonize_all(graphs)
+
+    # every END is split over three reads
+    process = nauty._Nauty__process
+    process.stdout = OneByteReader(process.stdout)
+    assert nauty.canonize_all(graphs) == ref_keys
+
 def test_make_nauty_input(nauty, ref_graph):
     colors = map(lambda node: node[1]['atom_type'], ref_graph.nodes(data=True))
     nauty_input = nauty._Nauty__make_nauty_input(ref_graph, colors)
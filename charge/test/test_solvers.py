@@ -1,7 +1,7 @@
 import pytest
 
-from charge.solvers import CDPSolver, DPSolver, ILPSolver, SimpleSolver, SymmetricILPSolver, SymmetricDPSolver, \
-    SymmetricCDPSolver, SymmetricRelaxedILPSolver
+from charge.solvers import AssignmentError, CDPSolver, DPSolver, ILPSolver, SimpleSolver, SymmetricILPSolver, \
+    SymmetricDPSolver, SymmetricCDPSolver, SymmetricRelaxedILPSolver
 
 
 def test_simple_solver(ref_graph):
@@ -34,8 +34,8 @@ def test_simple_solver(ref_graph):
     assert ref_graph.graph['score'] == pytest.approx(5.0)
 
 
-def test_ilp_solver(ref_graph):
-    solver = ILPSolver(2)
+def test_ilp_solver(ref_graph, ilp_backend):
+    solver = ILPSolver(2, backend=ilp_backend)
     charge_dists = {
             1: ([-0.62, -0.52, -0.42], [0.25, 0.5, 0.25]),
             2: ([0.11, 0.13, 0.15], [0.1, 0.8, 0.1]),
@@ -63,6 +63,69 @@ def test_ilp_solver(ref_graph):
     assert ref_graph.graph['total_charge'] == pytest.approx(0.0)
     assert ref_graph.graph['score'] == pytest.approx(3.7)
 
+    # aborted the interpreter with the HiGHS in SciPy 1.9
+    charge_dists = {
+            1: ([-0.05, 0.52, 0.75], [0.073, 0.963, 0.639]),
+            2: ([-0.5, -0.42, 0.45], [0.009, 0.439, 0.882]),
+            3: ([-0.72, 0.54, 0.55, 0.68], [0.602, 0.837, 0.667, 0.535]),
+            4: ([0.0, 0.18, 0.38], [0.543, 0.534, 0.51]),
+            5: ([-0.62, -0.53, -0.42, 0.02, 0.22, 0.35], [0.866, 0.902, 0.473, 0.12, 0.174, 0.72])
+            }
+    solver.solve_partial_charges(
+            ref_graph,
+            charge_dists,
+            0,
+            total_charge_diff=0.05)
+
+    assert ref_graph.graph['total_charge'] == pytest.approx(0.01)
+    assert ref_graph.graph['score'] == pytest.approx(3.823)
+
+    # reported as optimal by the HiGHS in SciPy 1.10 to 1.14
+    with pytest.raises(AssignmentError):
+        solver.solve_partial_charges(
+                ref_graph,
+                {1: ([-0.4, -0.3, 0.1, 0.36], [0.796, 0.893, 0.153, 0.388])},
+                0,
+                total_charge_diff=0.05)
+
+
+def test_ilp_solver_unknown_backend():
+    with pytest.raises(ValueError):
+        ILPSolver(2, backend='z3')
+
+
+def test_ilp_solver_highs_reuse(ref_graph):
+    pytest.importorskip('scipy', minversion='1.15')
+    solver = ILPSolver(2, backend='highs')
+    charge_dists = {
+            1: ([-0.62, -0.52, -0.42], [0.25, 0.5, 0.25]),
+            2: ([0.11, 0.13, 0.15], [0.1, 0.8, 0.1]),
+            3: ([0.11, 0.13, 0.15], [0.1, 0.8, 0.1]),
+            4: ([0.11, 0.13, 0.15], [0.1, 0.8, 0.1]),
+            5: ([0.11, 0.13, 0.15], [0.1, 0.8, 0.1])
+            }
+    solver.solve_partial_charges(ref_graph, charge_dists, 0)
+    selection = solver._ILPSolver__highs_model[1]
+
+    # same structure, different charges
+    charge_dists[1] = ([-0.72, -0.62, -0.52], [0.25, 0.5, 0.25])
+    solver.solve_partial_charges(ref_graph, charge_dists, 0)
+
+    assert solver._ILPSolver__highs_model[1] is selection
+    assert ref_graph.node[1]['partial_charge'] == -0.52
+    assert ref_graph.graph['total_charge'] == pytest.approx(0.0)
+    assert ref_graph.graph['score'] == pytest.approx(3.45)
+
+    # different structure
+    charge_dists[1] = ([-0.52], [1.0])
+    solver.solve_partial_charges(ref_graph, charge_dists, 0)
+
+    assert solver._ILPSolver__highs_model[1] is not selection
+    assert solver._ILPSolver__highs_model[1].shape == (5, 13)
+    assert ref_graph.node[1]['partial_charge'] == -0.52
+    assert ref_graph.graph['total_charge'] == pytest.approx(0.0)
+    assert ref_graph.graph['score'] == pytest.approx(4.2)
+
 def test_symmetricilp_solver(ref_graph):
     solver = SymmetricILPSolver(2)
     charge_dists = {
@@ -7,6 +7,15 @@ import networkx as nx
 
 from charge.babel import BondType
 
+try:
+    from numba import njit
+except ImportError:
+    def njit(*args, **kwargs):
+        """Stand-in for numba.njit that leaves functions uncompiled."""
+        def decorator(func):
+            return func
+        return decorator
+
 
 class AssignmentError(Warning):
     pass